@@ -1,18 +1,27 @@
 import streamlit as st
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
-import pypdf
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selectolax.lexbor import LexborHTMLParser
+import pymupdf
 import pptx
 import openai
+import asyncio
+import cachetools
+from aiolimiter import AsyncLimiter
+import concurrent.futures
+import functools
 import io
-import json
+import hashlib
+import orjson
+import pickle
 import re
+import threading
 import time
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+import xlsxwriter
 from urllib.parse import urlparse, urlunparse
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # --- Configuration ---
 st.set_page_config(page_title="AI Marketing Content Generator", layout="wide")
@@ -26,6 +35,24 @@ except Exception as e:
     st.error(f"Error loading OpenAI API key from secrets.toml: {e}")
     st.stop()
 
+# Regex patterns compiled once
+FILENAME_SANITIZE_RE = re.compile(r'[\\/*?:"<>|]')
+JSON_BLOCK_RE = re.compile(r'```(?:json)?\s*([\s\S]*?)\s*```', re.IGNORECASE)
+
+# Extracted context below this many characters (~7.5K tokens) goes into the prompts as-is, unsummarized
+RAW_CONTEXT_MAX_CHARS = 30_000
+
+# Rows shown per sheet in the in-app preview
+PREVIEW_ROWS = 20
+
+# Placeholder for sheets with no generated data. Shared between sheets, so it must never be mutated.
+EMPTY_DF = pd.DataFrame()
+
+# Sheet columns, in the order the prompts ask for them
+EMAIL_COLUMNS = ("Ad Name", "Objective", "Headline", "Subject Line", "Body", "CTA")
+LINKEDIN_COLUMNS = ("Ad Name", "Objective", "Introductory Text", "Image Copy", "Headline", "Destination", "CTA Button")
+FACEBOOK_COLUMNS = ("Ad Name", "Objective", "Primary Text", "Image Copy", "Headline", "Link Description", "Destination", "CTA Button")
+
 # --- Helper Functions ---
 
 def add_http(url):
@@ -43,21 +70,31 @@ def add_http(url):
             return url # Or raise an error, or return None
     return urlunparse(parsed)
 
+@st.cache_resource
+def get_http_session():
+    """Returns a pooled requests session shared across reruns, so TCP/TLS connections are reused."""
+    session = requests.Session()
+    session.headers.update({'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'})
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=Retry(total=2, backoff_factor=0.3))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 @st.cache_data(ttl=3600) # Cache for 1 hour
 def extract_text_from_url(url):
     """Extracts text content from a URL."""
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-        response = requests.get(url, headers=headers, timeout=20)
+        response = get_http_session().get(url, timeout=(5, 20)) # (connect, read) timeouts
         response.raise_for_status()  # Raise an exception for bad status codes
-        soup = BeautifulSoup(response.content, 'lxml') # Use lxml for better parsing
+        tree = LexborHTMLParser(response.content) # selectolax's lexbor backend parses in C
 
         # Remove script and style elements
-        for script_or_style in soup(["script", "style"]):
+        for script_or_style in tree.css("script, style"):
             script_or_style.decompose()
 
         # Get text, strip whitespace, and join lines
-        text = ' '.join(soup.stripped_strings)
+        body_text = tree.body.text(separator=' ', strip=True) if tree.body else ""
+        text = ' '.join(body_text.split())
         return text
     except requests.exceptions.RequestException as e:
         st.warning(f"Could not fetch URL {url}: {e}")
@@ -70,13 +107,9 @@ def extract_text_from_url(url):
 def extract_text_from_pdf(file):
     """Extracts text content from an uploaded PDF file."""
     try:
-        reader = pypdf.PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-        return text
+        # PyMuPDF parses in C (MuPDF); join page texts once instead of growing a string
+        with pymupdf.open(stream=file.getvalue(), filetype="pdf") as doc:
+            return "\n".join(page.get_text("text") for page in doc)
     except Exception as e:
         st.warning(f"Error reading PDF file {file.name}: {e}")
         return None
@@ -96,11 +129,33 @@ def extract_text_from_ppt(file):
         st.warning(f"Error reading PPT file {file.name}: {e}")
         return None
 
-def summarize_text(text, max_chars=3000, source_name=""):
-    """Summarizes text using OpenAI API."""
+def extract_text_from_source(source):
+    """Routes a context source (URL string or uploaded file) to the matching extractor."""
+    if isinstance(source, str):
+        return extract_text_from_url(source)
+    if source.type == "application/pdf":
+        return extract_text_from_pdf(source)
+    elif source.type == "application/vnd.openxmlformats-officedocument.presentationml.presentation":
+        return extract_text_from_ppt(source)
+    return None
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def summarize_text(text_hash, _text, max_chars=3000, source_name=""):
+    """Summarizes text using OpenAI API.
+
+    Cached on text_hash (a digest of the text) instead of the text itself, so Streamlit
+    doesn't re-hash large extracts on every run. API errors propagate so they are not cached.
+    """
+    text = _text
     if not text or not text.strip():
         return f"No content extracted from {source_name}." if source_name else "No content provided."
 
+    # Short inputs don't need an API call: use the text as-is, or trim it if only slightly over budget
+    if len(text) <= max_chars:
+        return text.strip()
+    if len(text) < max_chars * 1.2:
+        return text[:max_chars].strip()
+
     prompt = f"""
     Please summarize the following text extracted from '{source_name}'.
     Focus on the company's core offerings, value proposition, target audience, and key marketing messages.
@@ -115,50 +170,82 @@ def summarize_text(text, max_chars=3000, source_name=""):
     Summary:
     """ # Limit input text slightly to avoid hitting token limits easily
 
+    response = client.chat.completions.create(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant skilled in summarizing business context for marketing purposes."},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=1000, # Adjust based on expected summary length
+        temperature=0.5,
+    )
+    summary = response.choices[0].message.content.strip()
+    return summary
+
+@st.cache_resource
+def get_ad_content_cache():
+    """Returns the process-wide cache of parsed ad JSON (1 hour, 64 prompts) and its lock."""
+    return cachetools.TTLCache(maxsize=64, ttl=3600), threading.Lock()
+
+async def generate_ad_content(async_client, prompt, max_tokens=4000, is_valid_reply=None, on_chunk=None):
+    """Generates ad content, reusing the parsed result of an identical prompt from the last hour.
+
+    st.cache_data can't wrap coroutines, so results are kept in get_ad_content_cache() instead.
+    Only replies that pass is_valid_reply (if given) are cached, so a malformed one is retried next run.
+    """
+    cache, cache_lock = get_ad_content_cache()
+    cache_key = hashlib.blake2b(f"{max_tokens}\n{prompt}".encode(), digest_size=16).hexdigest()
+    with cache_lock:
+        json_content = cache.get(cache_key)
+    if json_content is None:
+        json_content = await request_ad_content(async_client, prompt, max_tokens, on_chunk)
+        if json_content is not None and (is_valid_reply is None or is_valid_reply(json_content)): # Don't cache failures
+            with cache_lock:
+                cache[cache_key] = json_content
+    return json_content
+
+async def request_ad_content(async_client, prompt, max_tokens=4000, on_chunk=None):
+    """Generates ad content with the given openai.AsyncOpenAI client, expecting JSON output.
+
+    The response is streamed; on_chunk, if given, is called with the length of each received chunk.
+    """
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant skilled in summarizing business context for marketing purposes."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1000, # Adjust based on expected summary length
-            temperature=0.5,
-        )
-        summary = response.choices[0].message.content.strip()
-        return summary
-    except Exception as e:
-        st.error(f"Error summarizing text from {source_name}: {e}")
-        return f"Error during summarization for {source_name}."
-
-def generate_ad_content(prompt):
-    """Generates ad content using OpenAI API, expecting JSON output."""
-    try:
-        response = client.chat.completions.create(
+        stream = await async_client.chat.completions.create(
             model=MODEL,
             messages=[
                 {"role": "system", "content": "You are an expert marketing copywriter. Generate ad content based on the provided context and instructions. Output *only* valid JSON."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=4000, # Allow ample tokens for JSON generation
+            max_tokens=max_tokens, # Allow ample tokens for JSON generation
             temperature=0.7,
+            seed=42, # Best-effort reproducibility, so a cached result stands in for a fresh one
             response_format={"type": "json_object"}, # Enforce JSON output if model supports it
+            stream=True, # Start receiving tokens right away instead of waiting for the full reply
         )
-        content = response.choices[0].message.content.strip()
+        chunks = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                chunks.append(delta)
+                if on_chunk:
+                    on_chunk(len(delta))
+        content = "".join(chunks).strip()
         # Basic validation if JSON is returned
         try:
-            json_content = json.loads(content)
+            json_content = orjson.loads(content)
             return json_content
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             st.error(f"AI did not return valid JSON. Raw response:\n```\n{content}\n```")
             # Attempt to extract JSON from potential markdown code blocks
-            match = re.search(r'```json\s*([\s\S]*?)\s*```', content, re.IGNORECASE)
+            match = JSON_BLOCK_RE.search(content)
             if match:
                 try:
-                    json_content = json.loads(match.group(1))
+                    json_content = orjson.loads(match.group(1))
                     st.warning("Extracted JSON from markdown block.")
                     return json_content
-                except json.JSONDecodeError:
+                except orjson.JSONDecodeError:
                     st.error("Failed to parse extracted JSON.")
                     return None
             return None # Indicate failure
@@ -166,75 +253,184 @@ def generate_ad_content(prompt):
         st.error(f"Error generating AI content: {e}")
         return None
 
+async def generate_all_ad_content(ad_requests, max_requests_per_second=3, on_progress=None, progress_interval=0.25):
+    """Runs the (prompt, max_tokens, is_valid_reply) requests concurrently and returns the results in request order.
+
+    on_progress, if given, is called with the total number of characters streamed so far,
+    at most once every progress_interval seconds.
+    """
+    # Token bucket: requests start immediately while capacity lasts and only wait once it runs out
+    limiter = AsyncLimiter(max_rate=max_requests_per_second, time_period=1) # Stay within OpenAI rate limits
+    received_chars = 0
+    last_progress = 0.0
+
+    def record_chunk(chunk_chars):
+        nonlocal received_chars, last_progress
+        received_chars += chunk_chars
+        # Each status update is its own websocket message, so don't send one per streamed token
+        now = time.monotonic()
+        if on_progress and now - last_progress >= progress_interval:
+            last_progress = now
+            on_progress(received_chars)
+
+    # The client's connection pool belongs to this event loop, so close it before asyncio.run() ends the loop
+    async with openai.AsyncOpenAI(api_key=openai.api_key) as async_client:
+        async def generate_with_limit(prompt, max_tokens, is_valid_reply):
+            async with limiter:
+                return await generate_ad_content(async_client, prompt, max_tokens, is_valid_reply, on_chunk=record_chunk)
+
+        return await asyncio.gather(*(generate_with_limit(*request) for request in ad_requests), return_exceptions=True)
+
+def is_text_list(value):
+    """True if value is a list; create_headline_frame stringifies whatever items it holds."""
+    return isinstance(value, list)
+
+def is_record_list(value, columns):
+    """True if value is a list of JSON objects that each carry at least one of the sheet's columns.
+
+    from_records drops keys outside columns, so records with none of them would become blank rows.
+    """
+    return isinstance(value, list) and all(isinstance(item, dict) and not item.keys().isdisjoint(columns) for item in value)
+
+def is_ads_by_objective(value, columns):
+    """True if value maps each objective to a list of ad objects with the sheet's columns."""
+    return isinstance(value, dict) and all(is_record_list(ads, columns) for ads in value.values())
+
+def has_sections(json_obj, section_keys, is_valid_section):
+    """True if json_obj is an object whose section_keys all hold values passing is_valid_section."""
+    return isinstance(json_obj, dict) and all(is_valid_section(json_obj.get(key)) for key in section_keys)
+
+def create_headline_frame(headlines, descriptions):
+    """Builds a Headline/Description DataFrame, padding the shorter column with NA."""
+    # Index alignment pads the shorter column with NA, so the lists are never padded in Python.
+    # Arrow-backed strings are already in the format st.dataframe sends to the browser.
+    return pd.DataFrame({
+        'Headline': pd.Series(pd.array(headlines, dtype="string[pyarrow]")),
+        'Description': pd.Series(pd.array(descriptions, dtype="string[pyarrow]")),
+    })
+
+def build_email_frame(emails):
+    """Builds the Email sheet from the model's "emails" array."""
+    return pd.DataFrame.from_records(emails, columns=EMAIL_COLUMNS)
+
+def build_objective_ads_frame(ads_by_objective, columns):
+    """Builds one sheet from ads keyed by objective, with a single from_records call over all of them."""
+    ads = [ad for objective_ads in ads_by_objective.values() for ad in objective_ads]
+    return pd.DataFrame.from_records(ads, columns=columns)
+
+def build_linkedin_frame(ads_by_objective):
+    """Builds the LinkedIn sheet from the model's "linkedin_ads_by_objective" object."""
+    return build_objective_ads_frame(ads_by_objective, LINKEDIN_COLUMNS)
+
+def build_facebook_frame(ads_by_objective):
+    """Builds the Facebook sheet from the model's "facebook_ads_by_objective" object."""
+    return build_objective_ads_frame(ads_by_objective, FACEBOOK_COLUMNS)
+
+# The one description of each reply's shape, used both to build the sheets and to decide what gets cached.
+# sheet name -> (label, request key, reply section holding the sheet (None for the whole reply),
+#                keys whose values are passed to the builder, section shape check, builder)
+SHEET_SOURCES = {
+    'Email': ('Email', 'Email', None, ('emails',), functools.partial(is_record_list, columns=EMAIL_COLUMNS), build_email_frame),
+    'LinkedIn': ('LinkedIn', 'LinkedIn', None, ('linkedin_ads_by_objective',), functools.partial(is_ads_by_objective, columns=LINKEDIN_COLUMNS), build_linkedin_frame),
+    'FaceBook': ('Facebook', 'FaceBook', None, ('facebook_ads_by_objective',), functools.partial(is_ads_by_objective, columns=FACEBOOK_COLUMNS), build_facebook_frame), # Note sheet name change
+    'Google Search': ('Google Search', 'Google', 'google_search', ('headlines', 'descriptions'), is_text_list, create_headline_frame),
+    'Google Display': ('Google Display', 'Google', 'google_display', ('headlines', 'descriptions'), is_text_list, create_headline_frame),
+}
+
+def sheet_json_from_reply(reply, reply_section):
+    """Returns the part of a parsed reply that a sheet is built from.
+
+    Anything but an object (e.g. an array pulled from a markdown block) is returned whole so the sheet reports it.
+    """
+    if reply_section is None or not isinstance(reply, dict):
+        return reply
+    return reply.get(reply_section)
+
+def is_complete_reply(request_key, reply):
+    """True if every sheet built from request_key's reply would pass its shape check."""
+    return all(
+        has_sections(sheet_json_from_reply(reply, reply_section), section_keys, is_valid_section)
+        for _, source_key, reply_section, section_keys, is_valid_section, _ in SHEET_SOURCES.values()
+        if source_key == request_key
+    )
+
+def excel_cell_value(value):
+    """Converts a DataFrame value into a value XlsxWriter can write."""
+    if isinstance(value, (list, tuple)):
+        return "\n".join(str(item) for item in value) # e.g. Image Copy returned as bullet points
+    if pd.isna(value):
+        return None # Written as a styled blank cell
+    return value
+
 def create_styled_excel(data_dict, company_name, lead_objective_str):
     """Creates a styled Excel file from the generated ad data."""
-    filename_safe_company_name = re.sub(r'[\\/*?:"<>|]', "", company_name) # Sanitize filename
+    filename_safe_company_name = FILENAME_SANITIZE_RE.sub("", company_name) # Sanitize filename
     filename_safe_objective = lead_objective_str.replace(" ", "_")
     filename = f"{filename_safe_company_name}_{filename_safe_objective}.xlsx"
 
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        # Define styles
-        header_font = Font(color="FFFFFF", bold=True)
-        header_fill = PatternFill(start_color="000000", end_color="000000", fill_type="solid")
-        header_alignment = Alignment(horizontal='center', vertical='center')
-        content_alignment = Alignment(vertical='middle', wrap_text=True)
-        thin_border_side = Side(border_style="thin", color="000000")
-        cell_border = Border(left=thin_border_side, right=thin_border_side, top=thin_border_side, bottom=thin_border_side)
-
-        # --- Write Sheets ---
-        for sheet_name, df in data_dict.items():
-            if df is not None and not df.empty:
-                df.to_excel(writer, sheet_name=sheet_name, index=False)
-                worksheet = writer.sheets[sheet_name]
-
-                # Apply styles
-                for row in worksheet.iter_rows():
-                    for cell in row:
-                        cell.alignment = content_alignment
-                        cell.border = cell_border
-
-                # Style Header Row
-                for cell in worksheet[1]:
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.alignment = header_alignment
-
-                # Adjust column widths (basic approach)
-                for col_idx, column in enumerate(df.columns):
-                    max_length = 0
-                    column_letter = get_column_letter(col_idx + 1)
-
-                    # Check header length
-                    if df[column].name:
-                       max_length = max(max_length, len(str(df[column].name)))
-
-                    # Check cell content lengths
-                    for cell in df[column]:
-                        try:
-                            if cell is not None:
-                                # Add a buffer for wrapped text lines
-                                cell_len = max(len(line) for line in str(cell).split('\n'))
-                                max_length = max(max_length, cell_len)
-                        except:
-                            pass # Ignore errors in length calculation
-
-                    # Set width (add padding) - max width around 70-80 to prevent huge columns
-                    adjusted_width = min((max_length + 5) * 1.2, 70)
-                    worksheet.column_dimensions[column_letter].width = adjusted_width
-
-            else:
-                # Create an empty sheet if no data was generated
-                workbook = writer.book
-                if sheet_name not in workbook.sheetnames:
-                     workbook.create_sheet(sheet_name)
-                worksheet = workbook[sheet_name]
-                worksheet['A1'] = f"No data generated for {sheet_name}"
-                # Apply basic styling if needed
+    # constant_memory flushes each row as soon as the next one starts instead of holding the whole sheet.
+    # strings_to_urls=False skips URL matching on every string and keeps links as plain text.
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'strings_to_urls': False})
+
+    # Define styles once per workbook; every content cell shares the one content format.
+    header_format = workbook.add_format({
+        'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#000000',
+        'align': 'center', 'valign': 'vcenter',
+        'border': 1, 'border_color': '#000000',
+    })
+    content_format = workbook.add_format({
+        'valign': 'vcenter', 'text_wrap': True,
+        'border': 1, 'border_color': '#000000',
+    })
+
+    # --- Write Sheets ---
+    for sheet_name, df in data_dict.items():
+        worksheet = workbook.add_worksheet(sheet_name)
+        if df is not None and not df.empty:
+            # Adjust column widths (basic approach)
+            for col_idx, column in enumerate(df.columns):
+                # Longest line of any wrapped cell, computed with vectorized string ops
+                line_lengths = df[column].dropna().astype(str).str.split('\n').explode().str.len()
+                max_length = len(str(column)) # Header length
+                if not line_lengths.empty:
+                    max_length = max(max_length, int(line_lengths.max()))
+
+                # Set width (add padding) - max width around 70-80 to prevent huge columns
+                adjusted_width = min((max_length + 5) * 1.2, 70)
+                worksheet.set_column(col_idx, col_idx, adjusted_width)
+
+            # Header Row
+            worksheet.write_row(0, 0, [str(column) for column in df.columns], header_format)
+
+            # Content Rows (written strictly top to bottom, as constant_memory requires)
+            for row_idx, row in enumerate(df.itertuples(index=False, name=None), start=1):
+                # The format goes on each cell rather than the column so borders stop at the last row
+                worksheet.write_row(row_idx, 0, [excel_cell_value(value) for value in row], content_format)
 
+        else:
+            # Create an empty sheet if no data was generated
+            worksheet.write('A1', f"No data generated for {sheet_name}")
+
+    workbook.close()
     output.seek(0)
     return output, filename
 
+def frames_digest(data_dict):
+    """Returns a digest of the sheet names and DataFrames (in sheet order) for use as a cache key."""
+    return hashlib.blake2b(pickle.dumps(data_dict, protocol=5), digest_size=16).hexdigest()
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def build_styled_excel(frames_hash, _data_dict, company_name, lead_objective_str):
+    """Cached create_styled_excel returning (xlsx bytes, filename).
+
+    Keyed on frames_hash (see frames_digest) so Streamlit doesn't hash the DataFrames itself.
+    Uses cache_resource rather than cache_data: the result is immutable bytes, so every rerun can
+    share the one cached object instead of unpickling a fresh copy of the workbook.
+    """
+    output, filename = create_styled_excel(_data_dict, company_name, lead_objective_str)
+    return output.getvalue(), filename # getvalue() hands over BytesIO's buffer without copying it
+
 # --- Prompt Design Functions ---
 
 def create_email_prompt(summary, count, objective_link):
@@ -252,165 +448,78 @@ def create_email_prompt(summary, count, objective_link):
     5.  Body: 2-3 paragraphs of persuasive copy. Embed the objective link '{objective_link}' naturally within the text (e.g., using markdown link format like [click here]({objective_link}) or similar phrasing). Focus on the value proposition and encourage the reader to take the next step.
     6.  CTA: A concise call-to-action phrase related to the body's main message (e.g., "Book Your Demo", "Schedule a Meeting").
 
-    Output the result as a JSON object with a single key "emails", which is an array of objects, each object representing an email variation with keys "Ad Name", "Objective", "Headline", "Subject Line", "Body", "CTA".
-
-    Example JSON structure:
-    {{
-      "emails": [
-        {{
-          "Ad Name": "Email_DemandCapture_Variant_1_FeatureX",
-          "Objective": "Demand Capture",
-          "Headline": "Unlock Feature X Benefits",
-          "Subject Line": "Ready to boost your results with Feature X?",
-          "Body": "Paragraph 1 introducing the problem and solution.\\n\\nParagraph 2 highlighting benefits and value. Learn more and [book your demo]({objective_link}) today!\\n\\nParagraph 3 reinforcing the call to action.",
-          "CTA": "Book Your Demo Now"
-        }},
-        // ... more email objects
-      ]
-    }}
+    Return a JSON object: {{"emails": [{{"Ad Name": str, "Objective": str, "Headline": str, "Subject Line": str, "Body": str, "CTA": str}}, ... x{count}]}}
     """
 
-def create_linkedin_prompt(summary, count, objective, destination_link, cta_button_text):
+def format_objectives_config(objectives_config):
+    """Formats the per-objective destination link and CTA button as prompt lines."""
+    return "\n".join(
+        f'    - "{cfg["objective"]}": Destination "{cfg["dest_link"]}", CTA Button "{cfg["cta"]}"'
+        for cfg in objectives_config
+    )
+
+def create_linkedin_multi_prompt(summary, count, objectives_config):
+    objectives = [cfg["objective"] for cfg in objectives_config]
     return f"""
     Based on the following company context summary:
     ---
     {summary}
     ---
-    Generate {count} distinct LinkedIn ad variations for the objective: '{objective}'.
+    Generate {count} distinct LinkedIn ad variations for EACH of the following objectives ({len(objectives)} objectives, {count * len(objectives)} ads in total):
+{format_objectives_config(objectives_config)}
+
     Each variation should include:
-    1.  Ad Name: A unique identifier (up to 250 chars), e.g., "LinkedIn_{objective.replace(' ','')}_Variant_1_Topic".
-    2.  Objective: "{objective}".
+    1.  Ad Name: A unique identifier (up to 250 chars), e.g., "LinkedIn_<Objective without spaces>_Variant_1_Topic".
+    2.  Objective: The objective the variation was written for.
     3.  Introductory Text: 300-400 characters. The first 150 characters must contain a strong hook. Include 1-2 relevant emojis naturally.
     4.  Image Copy: Suggest concise text (1-2 short phrases or bullet points) that could overlay an ad image, reinforcing the main message.
     5.  Headline: Around 70 characters, compelling and clear.
-    6.  Destination: The link "{destination_link}".
-    7.  CTA Button: "{cta_button_text}".
-
-    Output the result as a JSON object with a single key "linkedin_ads", which is an array of objects, each representing a LinkedIn ad variation with keys "Ad Name", "Objective", "Introductory Text", "Image Copy", "Headline", "Destination", "CTA Button".
-
-    Example JSON structure:
-    {{
-      "linkedin_ads": [
-        {{
-          "Ad Name": "LinkedIn_{objective.replace(' ','')}_Variant_1_BenefitY",
-          "Objective": "{objective}",
-          "Introductory Text": "Struggling with [Problem]? 🤔 Discover how [Company/Product] helps you achieve [Benefit]. Our solution offers [Value Prop]. Learn more! 👇 #Marketing #AdTech",
-          "Image Copy": "Achieve [Benefit] Faster | [Key Feature]",
-          "Headline": "Stop Guessing, Start Growing: Achieve [Benefit] Today",
-          "Destination": "{destination_link}",
-          "CTA Button": "{cta_button_text}"
-        }},
-        // ... more LinkedIn ad objects
-      ]
-    }}
+    6.  Destination: The destination link listed for the objective.
+    7.  CTA Button: The CTA button listed for the objective.
+
+    Return a JSON object keyed by objective ({", ".join(f'"{obj}"' for obj in objectives)}): {{"linkedin_ads_by_objective": {{"<objective>": [{{"Ad Name": str, "Objective": str, "Introductory Text": str, "Image Copy": str, "Headline": str, "Destination": str, "CTA Button": str}}, ... x{count}], ...}}}}
     """
 
-def create_facebook_prompt(summary, count, objective, destination_link, cta_button_text):
-     return f"""
+def create_facebook_multi_prompt(summary, count, objectives_config):
+    objectives = [cfg["objective"] for cfg in objectives_config]
+    return f"""
     Based on the following company context summary:
     ---
     {summary}
     ---
-    Generate {count} distinct Facebook ad variations for the objective: '{objective}'.
+    Generate {count} distinct Facebook ad variations for EACH of the following objectives ({len(objectives)} objectives, {count * len(objectives)} ads in total):
+{format_objectives_config(objectives_config)}
+
     Each variation should include:
-    1.  Ad Name: A unique identifier (up to 250 chars), e.g., "Facebook_{objective.replace(' ','')}_Variant_1_Topic".
-    2.  Objective: "{objective}".
+    1.  Ad Name: A unique identifier (up to 250 chars), e.g., "Facebook_<Objective without spaces>_Variant_1_Topic".
+    2.  Objective: The objective the variation was written for.
     3.  Primary Text: 300-400 characters. The first 125 characters must contain a strong hook. Include 1-2 relevant emojis naturally.
     4.  Image Copy: Suggest concise text (1-2 short phrases or bullet points) that could overlay an ad image, reinforcing the main message.
     5.  Headline: Around 27 characters, punchy and attention-grabbing.
     6.  Link Description: Around 27 characters, providing context for the link.
-    7.  Destination: The link "{destination_link}".
-    8.  CTA Button: "{cta_button_text}".
-
-    Output the result as a JSON object with a single key "facebook_ads", which is an array of objects, each representing a Facebook ad variation with keys "Ad Name", "Objective", "Primary Text", "Image Copy", "Headline", "Link Description", "Destination", "CTA Button".
-
-    Example JSON structure:
-    {{
-      "facebook_ads": [
-        {{
-          "Ad Name": "Facebook_{objective.replace(' ','')}_Variant_1_BenefitZ",
-          "Objective": "{objective}",
-          "Primary Text": "Tired of [Pain Point]? 😫 See how [Company/Product] makes [Task] easy! Get [Result] without the hassle. Click below to find out more! ✨",
-          "Image Copy": "[Benefit] Made Simple | Try Us Free",
-          "Headline": "Unlock [Benefit] Now!",
-          "Link Description": "Click here for details!",
-          "Destination": "{destination_link}",
-          "CTA Button": "{cta_button_text}"
-        }},
-        // ... more Facebook ad objects
-      ]
-    }}
+    7.  Destination: The destination link listed for the objective.
+    8.  CTA Button: The CTA button listed for the objective.
+
+    Return a JSON object keyed by objective ({", ".join(f'"{obj}"' for obj in objectives)}): {{"facebook_ads_by_objective": {{"<objective>": [{{"Ad Name": str, "Objective": str, "Primary Text": str, "Image Copy": str, "Headline": str, "Link Description": str, "Destination": str, "CTA Button": str}}, ... x{count}], ...}}}}
     """
 
-def create_google_search_prompt(summary):
+def create_google_prompt(summary):
     return f"""
     Based on the following company context summary:
     ---
     {summary}
     ---
-    Generate content for Google Search Responsive Search Ads (RSAs). Provide:
+    Generate content for both Google Search Responsive Search Ads (RSAs) and Google Display Responsive Display Ads.
+
+    Google Search - provide:
     1.  Headlines: Exactly 15 unique headlines, each around 30 characters maximum. Focus on keywords, benefits, and calls to action.
     2.  Descriptions: Exactly 4 unique descriptions, each around 90 characters maximum. Elaborate on value propositions and encourage clicks.
 
-    Output the result as a JSON object with two keys: "headlines" (an array of 15 strings) and "descriptions" (an array of 4 strings).
-
-    Example JSON structure:
-    {{
-      "headlines": [
-        "Headline 1 (Max 30 Chars)",
-        "Headline 2 - Benefit",
-        "Headline 3 - Keyword",
-        "Headline 4 - CTA",
-        "Headline 5 - Location?",
-        "Headline 6 - Offer",
-        "Headline 7 - Urgency",
-        "Headline 8 - Brand Name",
-        "Headline 9 - Feature",
-        "Headline 10 - Question?",
-        "Headline 11 - Social Proof",
-        "Headline 12 - Unique Value",
-        "Headline 13 - Simplicity",
-        "Headline 14 - Result",
-        "Headline 15 - Alternative CTA"
-      ],
-      "descriptions": [
-        "Description 1: Elaborate on key benefit and include a call to action. (Max 90 Chars)",
-        "Description 2: Highlight a different feature or value prop. Mention target audience maybe.",
-        "Description 3: Focus on problem/solution and unique selling points. Add credibility.",
-        "Description 4: Combine benefits and provide a clear next step for the user. Urgency/Offer."
-      ]
-    }}
-    """
-
-def create_google_display_prompt(summary):
-    return f"""
-    Based on the following company context summary:
-    ---
-    {summary}
-    ---
-    Generate content for Google Display Responsive Display Ads. Provide:
+    Google Display - provide:
     1.  Headlines: Exactly 5 unique headlines, each around 30 characters maximum. Focus on grabbing attention visually.
     2.  Descriptions: Exactly 5 unique descriptions, each around 90 characters maximum. Provide more context and encourage clicks.
 
-    Output the result as a JSON object with two keys: "headlines" (an array of 5 strings) and "descriptions" (an array of 5 strings).
-
-    Example JSON structure:
-    {{
-      "headlines": [
-        "Display Headline 1 (Max 30)",
-        "Benefit-Focused Headling",
-        "Short & Punchy Headline",
-        "Intriguing Question?",
-        "Clear Call to Action"
-      ],
-      "descriptions": [
-        "Display Description 1: Explain the offer or value proposition clearly. (Max 90 Chars)",
-        "Display Description 2: Focus on a key benefit relevant to display audiences.",
-        "Display Description 3: Highlight what makes the company/product unique.",
-        "Display Description 4: Encourage exploration or learning more.",
-        "Display Description 5: A concise summary with a call to action."
-      ]
-    }}
+    Return a JSON object: {{"google_search": {{"headlines": [str, ... x15], "descriptions": [str, ... x4]}}, "google_display": {{"headlines": [str, ... x5], "descriptions": [str, ... x5]}}}}
     """
 
 
@@ -448,6 +557,8 @@ generate_button = st.button("✨ Generate Ad Content")
 
 # --- Backend Flow ---
 if generate_button:
+    st.session_state.pop('results', None) # Don't offer the previous run's workbook if this one fails
+
     # Validate inputs
     if not company_url and not uploaded_context_files:
         st.error("Please provide a Website URL or upload at least one context file.")
@@ -484,237 +595,205 @@ if generate_button:
         except Exception:
             company_name = "CompanyName" # Fallback
 
-    # Initialize progress
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    total_steps = 6 # Extraction, Summarization, Email, LinkedIn, Facebook, Google, Excel
+    # Initialize progress: one status container whose label tracks the current step
+    # (Extraction, Summarization, Ad Generation, Excel)
+    status = st.status("Step 1/4: Extracting context...", expanded=False)
 
     extracted_texts = {}
     # 1. Extract Context
-    status_text.text("Step 1/6: Extracting context...")
+    context_sources = {} # name -> URL string or uploaded file, in display order
+    source_labels = {}
     if company_url:
-        url_text = extract_text_from_url(add_http(company_url))
-        if url_text:
-            extracted_texts['website'] = url_text
-            st.info(f"Extracted ~{len(url_text)} characters from {company_url}")
-        else:
-            st.warning(f"Could not extract text from {company_url}")
-
+        context_sources['website'] = add_http(company_url)
+        source_labels['website'] = company_url
     if uploaded_context_files:
         for file in uploaded_context_files:
-            file_content = None
-            if file.type == "application/pdf":
-                file_content = extract_text_from_pdf(file)
-            elif file.type == "application/vnd.openxmlformats-officedocument.presentationml.presentation":
-                file_content = extract_text_from_ppt(file)
-
-            if file_content:
-                extracted_texts[file.name] = file_content
-                st.info(f"Extracted ~{len(file_content)} characters from {file.name}")
-            else:
-                 st.warning(f"Could not extract text from {file.name}")
+            context_sources[file.name] = file
+            source_labels[file.name] = file.name
+
+    # Sources are independent, so fetch/parse them in parallel. Workers are attached to this
+    # script run so the cached extractors can still show their warnings.
+    script_ctx = get_script_run_ctx()
+    extraction_results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8, initializer=add_script_run_ctx, initargs=(None, script_ctx)) as executor:
+        futures = {executor.submit(extract_text_from_source, source): name for name, source in context_sources.items()}
+        for future in concurrent.futures.as_completed(futures):
+            extraction_results[futures[future]] = future.result()
+
+    for name in context_sources:
+        source_text = extraction_results[name]
+        if source_text:
+            extracted_texts[name] = source_text
+            st.info(f"Extracted ~{len(source_text)} characters from {source_labels[name]}")
+        else:
+            st.warning(f"Could not extract text from {source_labels[name]}")
 
     if not extracted_texts:
         st.error("No text could be extracted from the provided sources. Cannot proceed.")
+        status.update(label="No context could be extracted.", state="error")
         st.stop()
 
-    progress_bar.progress(1/total_steps)
-
     # 2. Summarize Context
-    status_text.text("Step 2/6: Summarizing context...")
+    status.update(label="Step 2/4: Summarizing context...")
     summaries = []
-    with st.spinner("AI is summarizing the extracted content..."):
+    failed_summaries = 0
+    total_chars = sum(len(text) for text in extracted_texts.values())
+    if total_chars < RAW_CONTEXT_MAX_CHARS:
+        # Small enough for the generation prompts to take directly, so skip the summarization calls
         for name, text in extracted_texts.items():
-            # Adjust max_chars based on input length?
-            max_chars = 3000 if len(text) > 5000 else 1800
-            summary = summarize_text(text, max_chars, name)
-            summaries.append(f"--- Context from {name} ---\n{summary}")
-            time.sleep(1) # Small delay between API calls
+            summaries.append(f"--- Context from {name} ---\n{text.strip()}")
+    else:
+        with st.spinner("AI is summarizing the extracted content..."):
+            for name, text in extracted_texts.items():
+                # Adjust max_chars based on input length?
+                max_chars = 3000 if len(text) > 5000 else 1800
+                text_hash = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+                try:
+                    summary = summarize_text(text_hash, text, max_chars, name)
+                except Exception as e:
+                    st.error(f"Error summarizing text from {name}: {e}")
+                    summary = f"Error during summarization for {name}."
+                    failed_summaries += 1
+                summaries.append(f"--- Context from {name} ---\n{summary}")
 
     combined_summary = "\n\n".join(summaries)
 
-    if not combined_summary or all("Error" in s for s in summaries):
+    if not combined_summary or failed_summaries == len(summaries):
          st.error("Failed to summarize the context. Cannot proceed.")
+         status.update(label="Summarization failed.", state="error")
          st.stop()
 
     st.subheader("Combined Summary for Ad Generation:")
     st.text_area("Summary", combined_summary, height=200)
-    progress_bar.progress(2/total_steps)
 
     # 3. Design Prompts & Generate Content
+    status.update(label="Step 3/4: Generating ad content...")
     generated_data = {}
     all_ads_data = {} # To store dataframes
 
-    # --- Email ---
-    status_text.text("Step 3/6: Generating Email Ads...")
-    with st.spinner("Generating Email content..."):
-        email_prompt = create_email_prompt(combined_summary, content_count, objective_link)
-        email_json = generate_ad_content(email_prompt)
-        if email_json and 'emails' in email_json:
-            try:
-                all_ads_data['Email'] = pd.DataFrame(email_json['emails'])
-                st.success("✅ Email content generated.")
-            except Exception as e:
-                st.error(f"Error creating Email DataFrame: {e}")
-                st.json(email_json) # Show raw JSON if parsing fails
-                all_ads_data['Email'] = pd.DataFrame() # Empty DF
-        else:
-            st.warning("Could not generate Email content.")
-            all_ads_data['Email'] = pd.DataFrame()
-    progress_bar.progress(3/total_steps)
-    time.sleep(1)
-
-    # --- LinkedIn ---
-    status_text.text("Step 4/6: Generating LinkedIn Ads...")
-    linkedin_dfs = []
-    linkedin_objectives = ["Brand Awareness", "Demand Gen", "Demand Capture"]
-    with st.spinner("Generating LinkedIn content..."):
-        for obj in linkedin_objectives:
-            status_text.text(f"Step 4/6: Generating LinkedIn Ads ({obj})...")
-            dest_link = learn_more_link
-            cta = "Learn More"
-            if obj == "Demand Gen":
-                dest_link = download_link
-                cta = "Download"
-            elif obj == "Demand Capture":
-                dest_link = objective_link
-                cta = "Register" if lead_objective == "Demo Booking" else "Request Demo" # Or Book Now? Adjust as needed
-
-            if not dest_link: # Fallback if a specific link is missing
-                 dest_link = learn_more_link if learn_more_link else company_url
-
-            linkedin_prompt = create_linkedin_prompt(combined_summary, content_count, obj, dest_link, cta)
-            linkedin_json = generate_ad_content(linkedin_prompt)
-            if linkedin_json and 'linkedin_ads' in linkedin_json:
-                 try:
-                    linkedin_dfs.append(pd.DataFrame(linkedin_json['linkedin_ads']))
-                 except Exception as e:
-                    st.error(f"Error creating LinkedIn DataFrame for {obj}: {e}")
-                    st.json(linkedin_json)
-            else:
-                st.warning(f"Could not generate LinkedIn content for {obj}.")
-            time.sleep(1) # Delay
-
-        if linkedin_dfs:
-            all_ads_data['LinkedIn'] = pd.concat(linkedin_dfs, ignore_index=True)
-            st.success("✅ LinkedIn content generated.")
-        else:
-            all_ads_data['LinkedIn'] = pd.DataFrame()
-    progress_bar.progress(4/total_steps)
+    # Build every prompt up front so the API calls can run concurrently
+    ad_requests = {} # key -> (prompt, max_tokens)
+    ad_requests['Email'] = (create_email_prompt(combined_summary, content_count, objective_link), 4000)
 
+    linkedin_objectives = ["Brand Awareness", "Demand Gen", "Demand Capture"]
+    linkedin_config = []
+    for obj in linkedin_objectives:
+        dest_link = learn_more_link
+        cta = "Learn More"
+        if obj == "Demand Gen":
+            dest_link = download_link
+            cta = "Download"
+        elif obj == "Demand Capture":
+            dest_link = objective_link
+            cta = "Register" if lead_objective == "Demo Booking" else "Request Demo" # Or Book Now? Adjust as needed
+
+        if not dest_link: # Fallback if a specific link is missing
+             dest_link = learn_more_link if learn_more_link else company_url
+
+        linkedin_config.append({"objective": obj, "dest_link": dest_link, "cta": cta})
+    # All objectives share one call, so budget output tokens for every objective's variations
+    ad_requests['LinkedIn'] = (create_linkedin_multi_prompt(combined_summary, content_count, linkedin_config), 12000)
 
-    # --- Facebook ---
-    status_text.text("Step 5/6: Generating Facebook Ads...")
-    facebook_dfs = []
     facebook_objectives = ["Brand Awareness", "Demand Gen", "Demand Capture"]
-    with st.spinner("Generating Facebook content..."):
-        for obj in facebook_objectives:
-            status_text.text(f"Step 5/6: Generating Facebook Ads ({obj})...")
-            dest_link = learn_more_link
-            cta = "Learn More"
-            if obj == "Demand Gen":
-                dest_link = download_link
-                cta = "Download"
-            elif obj == "Demand Capture":
-                dest_link = objective_link
-                cta = "Book Now" # Common FB CTA
-
-            if not dest_link: # Fallback
-                 dest_link = learn_more_link if learn_more_link else company_url
-
-            facebook_prompt = create_facebook_prompt(combined_summary, content_count, obj, dest_link, cta)
-            facebook_json = generate_ad_content(facebook_prompt)
-            if facebook_json and 'facebook_ads' in facebook_json:
-                try:
-                    facebook_dfs.append(pd.DataFrame(facebook_json['facebook_ads']))
-                except Exception as e:
-                    st.error(f"Error creating Facebook DataFrame for {obj}: {e}")
-                    st.json(facebook_json)
-            else:
-                st.warning(f"Could not generate Facebook content for {obj}.")
-            time.sleep(1) # Delay
-
-        if facebook_dfs:
-            all_ads_data['FaceBook'] = pd.concat(facebook_dfs, ignore_index=True) # Note sheet name change
-            st.success("✅ Facebook content generated.")
-        else:
-             all_ads_data['FaceBook'] = pd.DataFrame()
-    progress_bar.progress(5/total_steps)
-
-
-    # --- Google Search & Display ---
-    status_text.text("Step 6/6: Generating Google Ads & Excel...")
-    google_search_data = None
-    google_display_data = None
-
-    with st.spinner("Generating Google Search & Display content..."):
-        # Google Search
-        search_prompt = create_google_search_prompt(combined_summary)
-        search_json = generate_ad_content(search_prompt)
-        if search_json and 'headlines' in search_json and 'descriptions' in search_json:
-            try:
-                # Pad shorter list to make DataFrame creation easier
-                max_len = max(len(search_json['headlines']), len(search_json['descriptions']))
-                headlines = search_json['headlines'] + [None] * (max_len - len(search_json['headlines']))
-                descriptions = search_json['descriptions'] + [None] * (max_len - len(search_json['descriptions']))
-                google_search_data = pd.DataFrame({'Headline': headlines, 'Description': descriptions})
-                all_ads_data['Google Search'] = google_search_data
-                st.success("✅ Google Search content generated.")
-            except Exception as e:
-                st.error(f"Error creating Google Search DataFrame: {e}")
-                st.json(search_json)
-                all_ads_data['Google Search'] = pd.DataFrame()
-        else:
-            st.warning("Could not generate Google Search content.")
-            all_ads_data['Google Search'] = pd.DataFrame()
-        time.sleep(1)
-
-        # Google Display
-        display_prompt = create_google_display_prompt(combined_summary)
-        display_json = generate_ad_content(display_prompt)
-        if display_json and 'headlines' in display_json and 'descriptions' in display_json:
-             try:
-                max_len = max(len(display_json['headlines']), len(display_json['descriptions']))
-                headlines = display_json['headlines'] + [None] * (max_len - len(display_json['headlines']))
-                descriptions = display_json['descriptions'] + [None] * (max_len - len(display_json['descriptions']))
-                google_display_data = pd.DataFrame({'Headline': headlines, 'Description': descriptions})
-                all_ads_data['Google Display'] = google_display_data
-                st.success("✅ Google Display content generated.")
-             except Exception as e:
-                st.error(f"Error creating Google Display DataFrame: {e}")
-                st.json(display_json)
-                all_ads_data['Google Display'] = pd.DataFrame()
+    facebook_config = []
+    for obj in facebook_objectives:
+        dest_link = learn_more_link
+        cta = "Learn More"
+        if obj == "Demand Gen":
+            dest_link = download_link
+            cta = "Download"
+        elif obj == "Demand Capture":
+            dest_link = objective_link
+            cta = "Book Now" # Common FB CTA
+
+        if not dest_link: # Fallback
+             dest_link = learn_more_link if learn_more_link else company_url
+
+        facebook_config.append({"objective": obj, "dest_link": dest_link, "cta": cta})
+    ad_requests['FaceBook'] = (create_facebook_multi_prompt(combined_summary, content_count, facebook_config), 12000)
+
+    # Search and Display only depend on the summary, so they share one call
+    ad_requests['Google'] = (create_google_prompt(combined_summary), 4000)
+
+    with st.spinner("Generating Email, LinkedIn, Facebook and Google content..."):
+        results = asyncio.run(generate_all_ad_content(
+            # Only replies with every sheet in the expected shape are cached
+            [(prompt, max_tokens, functools.partial(is_complete_reply, key)) for key, (prompt, max_tokens) in ad_requests.items()],
+            on_progress=lambda chars: status.update(label=f"Step 3/4: Generating ad content... {chars:,} characters received"),
+        ))
+
+    for key, result in zip(ad_requests.keys(), results):
+        if isinstance(result, Exception):
+            st.error(f"Error generating AI content for {key}: {result}")
+            result = None
+        generated_data[key] = result
+
+    # --- Build a DataFrame per sheet ---
+    # Flag objectives the model skipped before building the combined LinkedIn/Facebook sheets
+    for label, platform_json, ads_key, objectives in (
+        ('LinkedIn', generated_data['LinkedIn'], 'linkedin_ads_by_objective', linkedin_objectives),
+        ('Facebook', generated_data['FaceBook'], 'facebook_ads_by_objective', facebook_objectives),
+    ):
+        ads_by_objective = platform_json.get(ads_key) if isinstance(platform_json, dict) else None
+        if isinstance(ads_by_objective, dict):
+            for obj in objectives:
+                if not ads_by_objective.get(obj):
+                    st.warning(f"Could not generate {label} content for {obj}.")
+
+    for sheet_name, (label, request_key, reply_section, section_keys, is_valid_section, build_frame) in SHEET_SOURCES.items():
+        sheet_json = sheet_json_from_reply(generated_data[request_key], reply_section)
+        # Look each section up once and hand the values straight to the builder
+        sections = [sheet_json.get(key) for key in section_keys] if isinstance(sheet_json, dict) else None
+        if sheet_json is None or (sections is not None and any(section is None for section in sections)):
+            st.warning(f"Could not generate {label} content.")
+            all_ads_data[sheet_name] = EMPTY_DF
+            continue
+        # Check the shape up front so the builder can run without a try/except around it
+        if sections is None or not all(is_valid_section(section) for section in sections):
+            st.error(f"Unexpected {label} JSON structure.")
+            # Show raw JSON (orjson pretty-prints much faster than st.json)
+            st.code(orjson.dumps(sheet_json, option=orjson.OPT_INDENT_2).decode(), language="json")
+            all_ads_data[sheet_name] = EMPTY_DF
+            continue
+        all_ads_data[sheet_name] = build_frame(*sections)
+        if all_ads_data[sheet_name].empty:
+            st.warning(f"Could not generate {label} content.")
         else:
-            st.warning("Could not generate Google Display content.")
-            all_ads_data['Google Display'] = pd.DataFrame()
+            st.success(f"✅ {label} content generated.")
 
     # 4. Parse and Format into XLSX
-    status_text.text("Formatting Excel file...")
+    status.update(label="Step 4/4: Formatting Excel file...")
     try:
-        excel_bytes, excel_filename = create_styled_excel(all_ads_data, company_name, lead_objective)
-        progress_bar.progress(1.0)
-        status_text.success("🎉 Content Generation Complete!")
-
-        # 5. Enable Download
-        st.download_button(
-            label="⬇️ Download Ad Content (.xlsx)",
-            data=excel_bytes,
-            file_name=excel_filename,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-
-        # Optionally display generated dataframes in the app
-        st.subheader("Generated Content Preview:")
-        for name, df in all_ads_data.items():
-            if df is not None and not df.empty:
-                st.markdown(f"### {name}")
-                st.dataframe(df)
-            else:
-                 st.markdown(f"### {name}")
-                 st.write(f"No data generated for {name}.")
-
-
+        excel_bytes, excel_filename = build_styled_excel(frames_digest(all_ads_data), all_ads_data, company_name, lead_objective)
+        status.update(label="🎉 Content Generation Complete!", state="complete")
+        # Kept in session state so the download and preview survive the reruns their widgets trigger
+        st.session_state['results'] = (all_ads_data, excel_bytes, excel_filename)
     except Exception as e:
         st.error(f"Error creating Excel file: {e}")
-        progress_bar.progress(1.0)
-        status_text.error("An error occurred during Excel file generation.")
\ No newline at end of file
+        status.update(label="An error occurred during Excel file generation.", state="error")
+
+# --- Results ---
+if 'results' in st.session_state:
+    all_ads_data, excel_bytes, excel_filename = st.session_state['results']
+
+    # 5. Enable Download
+    st.download_button(
+        label="⬇️ Download Ad Content (.xlsx)",
+        data=excel_bytes,
+        file_name=excel_filename,
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
+    # The workbook already has everything, so the preview is only rendered on request
+    if st.checkbox("Preview generated content", value=False):
+        st.subheader("Generated Content Preview:")
+        for name, df in all_ads_data.items():
+            has_data = df is not None and not df.empty
+            # Row count goes in the label so each preview is a single element inside its expander
+            label = f"{name} (first {PREVIEW_ROWS} of {len(df)} rows)" if has_data and len(df) > PREVIEW_ROWS else name
+            with st.expander(label, expanded=False):
+                if has_data:
+                    # Only the first rows are sent to the browser; the download has everything
+                    st.dataframe(df.head(PREVIEW_ROWS))
+                else:
+                     st.write(f"No data generated for {name}.")